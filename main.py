@@ -5,20 +5,63 @@ Runs workflow cells locally, but fetches workflow inputs from the Django server
 based on the workflow's saved `io_config`.
 """
 
+import asyncio
+import atexit
+import functools
+import hashlib
 import io
 import os
+import reprlib
 import sys
+import time
 import types
 import json
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timezone
 from pathlib import Path
 import importlib.abc
 import importlib.util
-from contextlib import redirect_stderr, redirect_stdout, contextmanager
+from contextlib import redirect_stderr, redirect_stdout, aclosing, asynccontextmanager, contextmanager
 
-from fastapi import FastAPI, Request
+from fastapi import FastAPI, Query, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import Response, StreamingResponse
+import orjson
+
+try:
+    import requests
+    from requests.adapters import HTTPAdapter
+    from urllib3.util.retry import Retry
+except ImportError:
+    requests = None
+
+try:
+    import httpx
+except ImportError:
+    httpx = None
+
+class ORJSONResponse(Response):
+    """JSON response encoded with orjson (bytes out, no stdlib json pass)."""
+
+    media_type = "application/json"
+
+    def render(self, content) -> bytes:
+        return orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY)
+
+
+async def _read_json(request: Request):
+    return orjson.loads(await request.body())
+
+
+async def _ndjson(first, items):
+    """Encode an async iterator of JSON items as newline-delimited JSON bytes."""
+    async with aclosing(items):
+        if first is not None:
+            yield orjson.dumps(first, option=orjson.OPT_APPEND_NEWLINE)
+        async for item in items:
+            yield orjson.dumps(item, option=orjson.OPT_APPEND_NEWLINE)
+
 
 def _apply_request_auth(request: Request):
     auth = request.headers.get("authorization") or request.headers.get("Authorization")
@@ -49,6 +92,11 @@ PASSWORD = os.getenv("WORKFLOW_AGENT_PASSWORD", "")
 REFRESH_TOKEN = os.getenv("WORKFLOW_AGENT_REFRESH_TOKEN", "")
 OUTPUT_MODE = os.getenv("WORKFLOW_AGENT_OUTPUT_MODE", "local")
 SSL_VERIFY = os.getenv("WORKFLOW_AGENT_SSL_VERIFY", "1").lower() not in ("0", "false", "no")
+META_CACHE_TTL = float(os.getenv("WORKFLOW_AGENT_META_CACHE_TTL", "60"))
+MAX_OUTPUT_CHARS = int(os.getenv("WORKFLOW_AGENT_MAX_OUTPUT_CHARS", str(256 * 1024)))
+MODULE_CACHE_DIR = Path(
+    os.getenv("WORKFLOW_AGENT_MODULE_CACHE_DIR", str(Path.home() / ".cache" / "workflow-agent" / "modules"))
+)
 
 if not SSL_VERIFY:
     try:
@@ -67,6 +115,98 @@ DISABLE_PETEX = os.getenv("WORKFLOW_AGENT_DISABLE_PETEX", "").lower() in (
     "true",
     "yes",
 )
+# Set when a reverse proxy answers CORS, so the app skips the middleware entirely.
+DISABLE_CORS = os.getenv("WORKFLOW_AGENT_DISABLE_CORS", "").lower() in (
+    "1",
+    "true",
+    "yes",
+)
+CORS_ORIGINS = [o.strip() for o in os.getenv("WORKFLOW_AGENT_CORS_ORIGINS", "*").split(",") if o.strip()]
+
+
+def _build_http_session():
+    """Shared keep-alive session for all calls to the main server."""
+    session = requests.Session()
+    adapter = HTTPAdapter(
+        pool_connections=4,
+        pool_maxsize=16,
+        max_retries=Retry(total=2, backoff_factor=0.2),
+    )
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+_HTTP = _build_http_session() if requests is not None else None
+if _HTTP is not None:
+    atexit.register(_HTTP.close)
+
+
+def _http_session(purpose: str):
+    if _HTTP is None:
+        raise ImportError(f"requests is required for {purpose}")
+    return _HTTP
+
+
+# url -> (validators, source bytes); L1 in front of the on-disk copies in MODULE_CACHE_DIR.
+_MODULE_SOURCES = {}
+
+
+def _module_cache_file(url: str) -> Path:
+    return MODULE_CACHE_DIR / f"{hashlib.sha1(url.encode('utf-8')).hexdigest()}.cache"
+
+
+def _cached_module_source(url: str):
+    cached = _MODULE_SOURCES.get(url)
+    if cached is not None:
+        return cached
+    try:
+        header, _, data = _module_cache_file(url).read_bytes().partition(b"\n")
+        validators = json.loads(header)
+    except (OSError, ValueError):
+        return None
+    cached = _MODULE_SOURCES[url] = (validators, data)
+    return cached
+
+
+def _store_module_source(url: str, resp, data: bytes):
+    validators = {}
+    if resp.headers.get("ETag"):
+        validators["etag"] = resp.headers["ETag"]
+    if resp.headers.get("Last-Modified"):
+        validators["last_modified"] = resp.headers["Last-Modified"]
+    if not validators:
+        # Nothing to revalidate with, so a cached copy could never be reused safely.
+        return
+    _MODULE_SOURCES[url] = (validators, data)
+    path = _module_cache_file(url)
+    tmp = path.with_suffix(f".{os.getpid()}.tmp")
+    try:
+        MODULE_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+        tmp.write_bytes(json.dumps(validators).encode("utf-8") + b"\n" + data)
+        os.replace(tmp, path)
+    except OSError:
+        tmp.unlink(missing_ok=True)
+
+
+def _fetch_module_source(session, url: str, headers: dict):
+    """GET a module source, revalidating any cached copy; returns (resp, bytes or None)."""
+    cached = _cached_module_source(url)
+    if cached is not None:
+        headers = dict(headers)
+        validators = cached[0]
+        if validators.get("etag"):
+            headers["If-None-Match"] = validators["etag"]
+        if validators.get("last_modified"):
+            headers["If-Modified-Since"] = validators["last_modified"]
+    resp = session.get(url, headers=headers, timeout=30, verify=SSL_VERIFY)
+    if resp.status_code == 304 and cached is not None:
+        return resp, cached[1]
+    if resp.status_code != 200:
+        return resp, None
+    data = resp.text.encode("utf-8")
+    _store_module_source(url, resp, data)
+    return resp, data
 
 
 class RemoteModuleLoader(importlib.abc.SourceLoader):
@@ -74,24 +214,21 @@ class RemoteModuleLoader(importlib.abc.SourceLoader):
         self.fullname = fullname
 
     def get_data(self, path):
-        try:
-            import requests
-        except ImportError as e:
-            raise ImportError("requests is required for remote imports") from e
+        session = _http_session("remote imports")
 
         module_path = path.replace(".", "/")
         url = f"{MAIN_SERVER_MODULE_URL}/{module_path}"
         headers = {"X-API-Key": API_KEY}
-        resp = requests.get(url, headers=headers, timeout=30, verify=SSL_VERIFY)
+        resp, data = _fetch_module_source(session, url, headers)
 
         if resp.status_code == 404 and "/" not in module_path.split("/")[-1]:
             url = f"{MAIN_SERVER_MODULE_URL}/{module_path}/__init__.py"
-            resp = requests.get(url, headers=headers, timeout=30, verify=SSL_VERIFY)
+            resp, data = _fetch_module_source(session, url, headers)
 
-        if resp.status_code != 200:
+        if data is None:
             raise ImportError(f"Failed to fetch: {url} ({resp.status_code})")
 
-        return resp.text.encode("utf-8")
+        return data
 
     def get_filename(self, fullname):
         return fullname
@@ -176,15 +313,53 @@ except Exception as e:
 
 teams = TeamsClient(ssl_verify=SSL_VERIFY)
 
-app = FastAPI(title="Workflow Agent (Petex + PI)", version="1.0")
-
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=["*"],
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
+def _init_cell_thread():
+    # Petex/COM objects created by cells are apartment-bound to this thread.
+    try:
+        import pythoncom
+    except ImportError:
+        return
+    pythoncom.CoInitialize()
+
+
+@asynccontextmanager
+async def _lifespan(app: FastAPI):
+    """Own the shared async HTTP client and the cell execution thread."""
+    http = None
+    if httpx is not None:
+        http = httpx.AsyncClient(
+            http2=importlib.util.find_spec("h2") is not None,
+            limits=httpx.Limits(max_connections=100, max_keepalive_connections=20),
+            timeout=60,
+            verify=SSL_VERIFY,
+        )
+    app.state.http = http
+    internal._http = http
+    internal._auth_lock = asyncio.Lock()  # bound to this loop on first contention
+    # One dedicated thread: GLOBAL_CONTEXT and redirected stdout/stderr are process-wide,
+    # and COM objects kept in the context must stay on the thread that created them.
+    app.state.exec_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="cell", initializer=_init_cell_thread)
+    app.state.exec_lock = asyncio.Lock()
+    try:
+        yield
+    finally:
+        app.state.exec_pool.shutdown(wait=False)
+        internal._http = None
+        app.state.http = None
+        if http is not None:
+            await http.aclose()
+
+
+app = FastAPI(title="Workflow Agent (Petex + PI)", version="1.0", lifespan=_lifespan, default_response_class=ORJSONResponse)
+
+if not DISABLE_CORS:
+    app.add_middleware(
+        CORSMiddleware,
+        allow_origins=CORS_ORIGINS,
+        allow_credentials=True,
+        allow_methods=["*"],
+        allow_headers=["*"],
+    )
 
 # ==============================================================
 # Ã°Å¸â€Â¹ Global Context
@@ -204,39 +379,134 @@ def _petex_server(enabled: bool):
 
 
 def _fetch_workflow_inputs(*, workflow_component_id: int):
-    try:
-        import requests
-    except ImportError as e:
-        raise ImportError("requests is required for workflow_load_inputs()") from e
+    session = _http_session("workflow_load_inputs()")
 
     url = f"{MAIN_SERVER_WORKFLOW_INPUTS_URL}/{int(workflow_component_id)}/"
     headers = {"X-API-Key": API_KEY}
-    resp = requests.get(url, headers=headers, timeout=60, verify=SSL_VERIFY)
+    resp = session.get(url, headers=headers, timeout=60, verify=SSL_VERIFY)
     if resp.status_code != 200:
         raise RuntimeError(f"Failed to fetch workflow inputs ({resp.status_code}): {resp.text}")
     return resp.json()
 
 
+_UTC = timezone.utc
+
+if sys.version_info >= (3, 11):
+    # Handles the trailing "Z" natively.
+    _parse_iso = datetime.fromisoformat
+else:
+
+    def _parse_iso(s: str) -> datetime:
+        if s.endswith("Z"):
+            s = s[:-1] + "+00:00"
+        return datetime.fromisoformat(s)
+
+
+def _id_from_int(item, by_name, id_key):
+    return item
+
+
+def _id_from_str(item, by_name, id_key):
+    if item.isdigit():
+        return int(item)
+    return by_name.get(item.casefold())
+
+
+def _id_from_dict(item, by_name, id_key):
+    if item.get("id") is not None:
+        return int(item["id"])
+    if item.get(id_key) is not None:
+        return int(item[id_key])
+    if item.get("name"):
+        return by_name.get(str(item["name"]).casefold())
+    return None
+
+
+def _id_from_other(item, by_name, id_key):
+    # Subclasses (bool, OrderedDict, ...) and model-like objects with `.pk`.
+    if item is None:
+        return None
+    if isinstance(item, dict):
+        return _id_from_dict(item, by_name, id_key)
+    if hasattr(item, "pk"):
+        return int(item.pk)
+    if isinstance(item, int):
+        return item
+    if isinstance(item, str):
+        return _id_from_str(item, by_name, id_key)
+    return None
+
+
+_ID_RESOLVERS = {int: _id_from_int, str: _id_from_str, dict: _id_from_dict}
+
+
+def _name_key(name) -> str:
+    return str(name).casefold()
+
+
+def _index_id(value):
+    return int(value) if value else None
+
+
+def _resolve_ids(items, by_name, id_key):
+    """Resolve ids/names/dicts/model objects to a set of ids via `by_name` (casefolded name -> int id)."""
+    ids = set()
+    for item in items:
+        val = _ID_RESOLVERS.get(type(item), _id_from_other)(item, by_name, id_key)
+        if val is not None:
+            ids.add(val)
+    return ids
+
+
 class InternalClient:
-    def __init__(self, base_url: str, api_key: str | None = None, auth_token: str | None = None, username: str | None = None, password: str | None = None, refresh_token: str | None = None):
+    """Client for the main server's internal data API.
+
+    The sync methods (`get_records`, `get_history`) are what workflow code uses.
+    The `a`-prefixed coroutines do the same over the shared `httpx.AsyncClient`
+    bound at app startup, so FastAPI handlers can await them without blocking
+    the event loop.
+
+    Components and object metadata change rarely, so they are cached for
+    `cache_ttl` seconds per auth token (callers may see different data);
+    `clear_cache()` drops them early.
+    """
+
+    # Upper bound on in-flight requests when the async API fans out.
+    max_concurrency = 20
+
+    def __init__(self, base_url: str, api_key: str | None = None, auth_token: str | None = None, username: str | None = None, password: str | None = None, refresh_token: str | None = None, http=None, cache_ttl: float = 60):
         self.base_url = base_url.rstrip("/")
         self.api_key = api_key or ""
         self.auth_token = auth_token or ""
         self.username = username or ""
         self.password = password or ""
         self.refresh_token = refresh_token or ""
+        self._http = http
+        # Serializes async login/refresh so concurrent requests share one new token.
+        self._auth_lock = asyncio.Lock()
+        self.cache_ttl = cache_ttl
+        self._cache = {}
+        self._index_cache = {}
+
+    def clear_cache(self):
+        self._cache.clear()
+        self._index_cache.clear()
+
+    def _cache_get(self, key):
+        entry = self._cache.get((key, self.auth_token))
+        if entry is None or entry[0] <= time.monotonic():
+            return None
+        return entry[1]
 
-    def _refresh_token(self):
-        if not self.refresh_token:
-            return False
-        try:
-            import requests
-        except ImportError as e:
-            raise ImportError("requests is required for token refresh") from e
-        resp = requests.post(MAIN_SERVER_REFRESH_URL, json={"refresh": self.refresh_token}, timeout=30, verify=SSL_VERIFY)
-        if resp.status_code != 200:
-            return False
-        data = resp.json()
+    def _cache_put(self, key, value):
+        if self.cache_ttl > 0:
+            now = time.monotonic()
+            # Tokens rotate per request, so drop expired entries rather than let them pile up.
+            self._cache = {k: entry for k, entry in self._cache.items() if entry[0] > now}
+            self._cache[(key, self.auth_token)] = (now + self.cache_ttl, value)
+        return value
+
+    def _apply_tokens(self, data):
         token = data.get("access") or data.get("token") or data.get("access_token")
         if not token:
             return False
@@ -246,6 +516,15 @@ class InternalClient:
             self.refresh_token = new_refresh
         return True
 
+    def _refresh_token(self):
+        if not self.refresh_token:
+            return False
+        session = _http_session("token refresh")
+        resp = session.post(MAIN_SERVER_REFRESH_URL, json={"refresh": self.refresh_token}, timeout=30, verify=SSL_VERIFY)
+        if resp.status_code != 200:
+            return False
+        return self._apply_tokens(resp.json())
+
     def _ensure_token(self):
         if self.auth_token:
             return
@@ -254,24 +533,18 @@ class InternalClient:
                 return
         if not self.username or not self.password:
             return
-        try:
-            import requests
-        except ImportError as e:
-            raise ImportError("requests is required for InternalClient auth") from e
-        resp = requests.post(MAIN_SERVER_LOGIN_URL, json={"username": self.username, "password": self.password}, timeout=30, verify=SSL_VERIFY)
+        session = _http_session("InternalClient auth")
+        resp = session.post(MAIN_SERVER_LOGIN_URL, json={"username": self.username, "password": self.password}, timeout=30, verify=SSL_VERIFY)
         if resp.status_code != 200:
             raise RuntimeError(f"Auth token request failed ({resp.status_code}): {resp.text}")
-        data = resp.json()
-        token = data.get("access") or data.get("token") or data.get("access_token")
-        if not token:
+        if not self._apply_tokens(resp.json()):
             raise RuntimeError("Auth token missing in response")
-        self.auth_token = token
-        new_refresh = data.get("refresh") or data.get("refresh_token")
-        if new_refresh:
-            self.refresh_token = new_refresh
 
     def _headers(self):
         self._ensure_token()
+        return self._auth_headers()
+
+    def _auth_headers(self):
         if not self.auth_token:
             raise RuntimeError('Missing auth token. Set WORKFLOW_AGENT_AUTH_TOKEN or WORKFLOW_AGENT_USERNAME/WORKFLOW_AGENT_PASSWORD.')
         headers = {}
@@ -282,40 +555,126 @@ class InternalClient:
         return headers
 
     def _request(self, path: str, params: dict | None = None):
-        try:
-            import requests
-        except ImportError as e:
-            raise ImportError("requests is required for InternalClient") from e
+        session = _http_session("InternalClient")
         url = f"{self.base_url}{path}"
-        resp = requests.get(url, headers=self._headers(), params=params, timeout=60, verify=SSL_VERIFY)
+        resp = session.get(url, headers=self._headers(), params=params, timeout=60, verify=SSL_VERIFY)
         if resp.status_code == 401 and self._refresh_token():
-            resp = requests.get(url, headers=self._headers(), params=params, timeout=60, verify=SSL_VERIFY)
+            resp = session.get(url, headers=self._headers(), params=params, timeout=60, verify=SSL_VERIFY)
         if resp.status_code != 200:
             raise RuntimeError(f"Internal API failed ({resp.status_code}): {resp.text}")
         return resp.json()
 
+    def _async_http(self):
+        if self._http is None:
+            raise RuntimeError("Async internal API is unavailable: httpx client is not started")
+        return self._http
+
+    async def _arefresh_token(self):
+        if not self.refresh_token:
+            return False
+        resp = await self._async_http().post(MAIN_SERVER_REFRESH_URL, json={"refresh": self.refresh_token}, timeout=30)
+        if resp.status_code != 200:
+            return False
+        return self._apply_tokens(resp.json())
+
+    async def _aensure_token(self):
+        if self.auth_token:
+            return
+        async with self._auth_lock:
+            if self.auth_token:
+                return
+            if self.refresh_token:
+                if await self._arefresh_token():
+                    return
+            if not self.username or not self.password:
+                return
+            resp = await self._async_http().post(MAIN_SERVER_LOGIN_URL, json={"username": self.username, "password": self.password}, timeout=30)
+            if resp.status_code != 200:
+                raise RuntimeError(f"Auth token request failed ({resp.status_code}): {resp.text}")
+            if not self._apply_tokens(resp.json()):
+                raise RuntimeError("Auth token missing in response")
+
+    async def _arefresh_expired(self, sent_token: str):
+        """Refresh after a 401 on `sent_token`, unless another request already replaced it."""
+        async with self._auth_lock:
+            if self.auth_token != sent_token:
+                return True
+            return await self._arefresh_token()
+
+    async def _aheaders(self):
+        await self._aensure_token()
+        return self._auth_headers()
+
+    async def _arequest(self, path: str, params: dict | None = None):
+        http = self._async_http()
+        url = f"{self.base_url}{path}"
+        headers = await self._aheaders()
+        sent_token = self.auth_token
+        resp = await http.get(url, headers=headers, params=params, timeout=60)
+        if resp.status_code == 401 and await self._arefresh_expired(sent_token):
+            resp = await http.get(url, headers=await self._aheaders(), params=params, timeout=60)
+        if resp.status_code != 200:
+            raise RuntimeError(f"Internal API failed ({resp.status_code}): {resp.text}")
+        return resp.json()
+
+    async def _aiter_requests(self, paths):
+        """`_arequest` each path concurrently (at most `max_concurrency` in flight), yielding results in input order."""
+        sem = asyncio.Semaphore(self.max_concurrency)
+
+        async def fetch(path):
+            async with sem:
+                return await self._arequest(path)
+
+        tasks = [asyncio.ensure_future(fetch(path)) for path in paths]
+        try:
+            for task in tasks:
+                yield await task
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def _arequest_many(self, paths):
+        async with aclosing(self._aiter_requests(paths)) as results:
+            return [result async for result in results]
+
     def _parse_dt(self, value):
         if not value:
             return None
         if isinstance(value, datetime):
             dt = value
         else:
-            s = str(value)
-            if s.endswith("Z"):
-                s = s[:-1] + "+00:00"
             try:
-                dt = datetime.fromisoformat(s)
+                dt = _parse_iso(str(value))
             except Exception:
                 return None
-        if dt.tzinfo is None or dt.tzinfo.utcoffset(dt) is None:
-            dt = dt.replace(tzinfo=timezone.utc)
+        if dt.tzinfo is None or dt.utcoffset() is None:
+            dt = dt.replace(tzinfo=_UTC)
         return dt
 
     def _components(self):
-        return self._request("/data-sources/Internal/components/")
+        cached = self._cache_get("components")
+        if cached is None:
+            cached = self._cache_put("components", self._request("/data-sources/Internal/components/"))
+        return cached
 
     def _metadata(self):
-        return self._request("/object-metadata/")
+        cached = self._cache_get("metadata")
+        if cached is None:
+            cached = self._cache_put("metadata", self._request("/object-metadata/"))
+        return cached
+
+    async def _acomponents(self):
+        cached = self._cache_get("components")
+        if cached is None:
+            cached = self._cache_put("components", await self._arequest("/data-sources/Internal/components/"))
+        return cached
+
+    async def _ametadata(self):
+        cached = self._cache_get("metadata")
+        if cached is None:
+            cached = self._cache_put("metadata", await self._arequest("/object-metadata/"))
+        return cached
 
     def _build_meta_maps(self, meta):
         type_map = {t.get("id"): t.get("name") for t in meta.get("types", [])}
@@ -329,219 +688,195 @@ class InternalClient:
                 prop_map[prop.get("id")] = prop.get("name")
         return type_map, instance_map, prop_map
 
-    def _resolve_component_ids(self, components):
-        comps = self._components()
-        by_id = {c.get("id"): c for c in comps}
-        by_name = {str(c.get("name", "")).lower(): c for c in comps}
+    def _build_meta_index(self, meta):
+        instances = {}
+        for _tname, insts in (meta.get("instances") or {}).items():
+            for inst in insts:
+                instances[_name_key(inst.get("name", ""))] = _index_id(inst.get("id"))
+        properties = {}
+        for _tname, props in (meta.get("properties") or {}).items():
+            for prop in props:
+                properties[_name_key(prop.get("name", ""))] = _index_id(prop.get("id"))
+        return {
+            "maps": self._build_meta_maps(meta),
+            "types": {_name_key(t.get("name", "")): _index_id(t.get("id")) for t in meta.get("types", [])},
+            "instances": instances,
+            "properties": properties,
+        }
+
+    def _build_component_index(self, comps):
+        return {
+            "by_id": {c.get("id"): c for c in comps},
+            "by_name": {_name_key(c.get("name", "")): _index_id(c.get("id")) for c in comps},
+        }
+
+    def _snapshot_index(self, key, source, build):
+        """Return `build(source)`, rebuilt only when the cached `source` object changes."""
+        cached = self._index_cache.get(key)
+        if cached is None or cached[0] is not source:
+            cached = self._index_cache[key] = (source, build(source))
+        return cached[1]
+
+    def _resolve_component_ids(self, components, comps):
+        index = self._snapshot_index("components", comps, self._build_component_index)
+        by_id = index["by_id"]
         if not components:
             ids = [c.get("id") for c in comps]
             return [i for i in ids if i], by_id
-        ids = []
-        for item in components:
-            if item is None:
-                continue
-            if isinstance(item, dict):
-                if item.get("id") is not None:
-                    ids.append(int(item["id"]))
-                elif item.get("component_id") is not None:
-                    ids.append(int(item["component_id"]))
-                elif item.get("name"):
-                    comp = by_name.get(str(item["name"]).lower())
-                    if comp:
-                        ids.append(comp.get("id"))
-                continue
-            if hasattr(item, "pk"):
-                ids.append(int(item.pk))
-                continue
-            if isinstance(item, int):
-                ids.append(item)
-                continue
-            if isinstance(item, str):
-                if item.isdigit():
-                    ids.append(int(item))
-                else:
-                    comp = by_name.get(item.lower())
-                    if comp:
-                        ids.append(comp.get("id"))
-                continue
-        ids = [i for i in ids if i in by_id]
-        return sorted(set(ids)), by_id
+        ids = _resolve_ids(components, index["by_name"], "component_id")
+        return sorted(i for i in ids if i in by_id), by_id
 
-    def _resolve_type_ids(self, object_type, meta):
+    def _resolve_type_ids(self, object_type, index):
         if object_type is None:
             return set()
-        types = meta.get("types", [])
-        by_name = {str(t.get("name", "")).lower(): t.get("id") for t in types}
         items = object_type if isinstance(object_type, (list, tuple, set)) else [object_type]
-        ids = set()
-        for item in items:
-            if item is None:
-                continue
-            if isinstance(item, dict):
-                if item.get("id") is not None:
-                    ids.add(int(item["id"]))
-                elif item.get("object_type_id") is not None:
-                    ids.add(int(item["object_type_id"]))
-                elif item.get("name"):
-                    val = by_name.get(str(item["name"]).lower())
-                    if val:
-                        ids.add(int(val))
-                continue
-            if hasattr(item, "pk"):
-                ids.add(int(item.pk))
-                continue
-            if isinstance(item, int):
-                ids.add(item)
-                continue
-            if isinstance(item, str):
-                if item.isdigit():
-                    ids.add(int(item))
-                else:
-                    val = by_name.get(item.lower())
-                    if val:
-                        ids.add(int(val))
-                continue
-        return ids
+        return _resolve_ids(items, index["types"], "object_type_id")
 
-    def _resolve_instance_ids(self, instances, meta):
+    def _resolve_instance_ids(self, instances, index):
         if not instances:
             return set()
-        instance_map = meta.get("instances", {})
-        by_name = {}
-        for _tname, insts in instance_map.items():
-            for inst in insts:
-                by_name[str(inst.get("name", "")).lower()] = inst.get("id")
-        ids = set()
-        for item in instances:
-            if item is None:
-                continue
-            if isinstance(item, dict):
-                if item.get("id") is not None:
-                    ids.add(int(item["id"]))
-                elif item.get("object_instance_id") is not None:
-                    ids.add(int(item["object_instance_id"]))
-                elif item.get("name"):
-                    val = by_name.get(str(item["name"]).lower())
-                    if val:
-                        ids.add(int(val))
-                continue
-            if hasattr(item, "pk"):
-                ids.add(int(item.pk))
-                continue
-            if isinstance(item, int):
-                ids.add(item)
-                continue
-            if isinstance(item, str):
-                if item.isdigit():
-                    ids.add(int(item))
-                else:
-                    val = by_name.get(item.lower())
-                    if val:
-                        ids.add(int(val))
-                continue
-        return ids
+        return _resolve_ids(instances, index["instances"], "object_instance_id")
 
-    def _resolve_property_ids(self, properties, meta):
+    def _resolve_property_ids(self, properties, index):
         if not properties:
             return set()
-        props_map = meta.get("properties", {})
-        by_name = {}
-        for _tname, props in props_map.items():
-            for prop in props:
-                by_name[str(prop.get("name", "")).lower()] = prop.get("id")
-        ids = set()
-        for item in properties:
-            if item is None:
+        return _resolve_ids(properties, index["properties"], "object_type_property_id")
+
+    def _records_query(self, comps, meta, components, object_type, instances, properties):
+        comp_ids, comp_by_id = self._resolve_component_ids(components, comps)
+        index = self._snapshot_index("metadata", meta, self._build_meta_index)
+        return {
+            "comp_ids": comp_ids,
+            "comp_by_id": comp_by_id,
+            "maps": index["maps"],
+            "type_ids": self._resolve_type_ids(object_type, index),
+            "instance_ids": self._resolve_instance_ids(instances, index),
+            "property_ids": self._resolve_property_ids(properties, index),
+        }
+
+    def _enrich_records(self, comp_id, records, query):
+        type_ids = query["type_ids"]
+        instance_ids = query["instance_ids"]
+        property_ids = query["property_ids"]
+        type_map, instance_map, prop_map = query["maps"]
+        comp = query["comp_by_id"].get(comp_id) or {}
+        out = []
+        for rec in records:
+            if type_ids and rec.get("object_type") not in type_ids:
                 continue
-            if isinstance(item, dict):
-                if item.get("id") is not None:
-                    ids.add(int(item["id"]))
-                elif item.get("object_type_property_id") is not None:
-                    ids.add(int(item["object_type_property_id"]))
-                elif item.get("name"):
-                    val = by_name.get(str(item["name"]).lower())
-                    if val:
-                        ids.add(int(val))
+            if instance_ids and rec.get("object_instance") not in instance_ids:
                 continue
-            if hasattr(item, "pk"):
-                ids.add(int(item.pk))
+            if property_ids and rec.get("object_type_property") not in property_ids:
                 continue
-            if isinstance(item, int):
-                ids.add(item)
+            rec["component_id"] = rec.get("component") or comp_id
+            if comp:
+                rec["component__name"] = comp.get("name", "")
+            rec["object_type__object_type_name"] = type_map.get(rec.get("object_type"), "")
+            rec["object_instance__object_instance_name"] = instance_map.get(rec.get("object_instance"), "")
+            rec["object_type_property__object_type_property_name"] = prop_map.get(rec.get("object_type_property"), "")
+            out.append(rec)
+        return out
+
+    def _history_path(self, rec):
+        comp_id = rec.get("component") or rec.get("component_id")
+        row_id = rec.get("data_set_id") or rec.get("id")
+        if not comp_id or not row_id:
+            return None
+        return f"/components/{int(comp_id)}/row/{int(row_id)}/history/"
+
+    def _enrich_history(self, rec, history, maps, start_dt, end_dt):
+        type_map, instance_map, prop_map = maps
+        comp_id = rec.get("component") or rec.get("component_id")
+        row_id = rec.get("data_set_id") or rec.get("id")
+        out = []
+        for item in history:
+            t = item.get("time")
+            dt = self._parse_dt(t)
+            if start_dt and dt and dt < start_dt:
                 continue
-            if isinstance(item, str):
-                if item.isdigit():
-                    ids.add(int(item))
-                else:
-                    val = by_name.get(item.lower())
-                    if val:
-                        ids.add(int(val))
+            if end_dt and dt and dt > end_dt:
                 continue
-        return ids
+            type_id = rec.get("object_type")
+            instance_id = rec.get("object_instance")
+            prop_id = rec.get("object_type_property")
+            item["component_id"] = comp_id
+            item["main_record_id"] = row_id
+            item["object_type_name"] = type_map.get(type_id, "")
+            item["object_instance_name"] = instance_map.get(instance_id, "")
+            item["object_type_property_name"] = prop_map.get(prop_id, "")
+            out.append(item)
+        return out
 
-    def get_records(self, components=None, object_type=None, instances=None, properties=None):
-        comp_ids, comp_by_id = self._resolve_component_ids(components)
-        meta = self._metadata()
-        type_map, instance_map, prop_map = self._build_meta_maps(meta)
-        type_ids = self._resolve_type_ids(object_type, meta)
-        instance_ids = self._resolve_instance_ids(instances, meta)
-        property_ids = self._resolve_property_ids(properties, meta)
+    def _get_records(self, components, object_type, instances, properties):
+        comps = self._components()
+        query = self._records_query(comps, self._metadata(), components, object_type, instances, properties)
         out = []
-        for comp_id in comp_ids:
+        for comp_id in query["comp_ids"]:
             records = self._request(f"/components/internal/{int(comp_id)}")
-            for rec in records:
-                if type_ids and rec.get("object_type") not in type_ids:
-                    continue
-                if instance_ids and rec.get("object_instance") not in instance_ids:
-                    continue
-                if property_ids and rec.get("object_type_property") not in property_ids:
-                    continue
-                rec["component_id"] = rec.get("component") or comp_id
-                comp = comp_by_id.get(comp_id) or {}
-                if comp:
-                    rec["component__name"] = comp.get("name", "")
-                rec["object_type__object_type_name"] = type_map.get(rec.get("object_type"), "")
-                rec["object_instance__object_instance_name"] = instance_map.get(rec.get("object_instance"), "")
-                rec["object_type_property__object_type_property_name"] = prop_map.get(rec.get("object_type_property"), "")
-                out.append(rec)
-        return out
+            out.extend(self._enrich_records(comp_id, records, query))
+        return out, query
+
+    def get_records(self, components=None, object_type=None, instances=None, properties=None):
+        return self._get_records(components, object_type, instances, properties)[0]
 
     def get_history(self, components=None, object_type=None, instances=None, properties=None, start=None, end=None):
-        records = self.get_records(components=components, object_type=object_type, instances=instances, properties=properties)
-        meta = self._metadata()
-        type_map, instance_map, prop_map = self._build_meta_maps(meta)
+        records, query = self._get_records(components, object_type, instances, properties)
+        maps = query["maps"]
         start_dt = self._parse_dt(start)
         end_dt = self._parse_dt(end)
         out = []
         for rec in records:
-            comp_id = rec.get("component") or rec.get("component_id")
-            row_id = rec.get("data_set_id") or rec.get("id")
-            if not comp_id or not row_id:
+            path = self._history_path(rec)
+            if path is None:
                 continue
-            history = self._request(f"/components/{int(comp_id)}/row/{int(row_id)}/history/")
-            for item in history:
-                t = item.get("time")
-                dt = self._parse_dt(t)
-                if start_dt and dt and dt < start_dt:
-                    continue
-                if end_dt and dt and dt > end_dt:
-                    continue
-                type_id = rec.get("object_type")
-                instance_id = rec.get("object_instance")
-                prop_id = rec.get("object_type_property")
-                item["component_id"] = comp_id
-                item["main_record_id"] = row_id
-                item["object_type_name"] = type_map.get(type_id, "")
-                item["object_instance_name"] = instance_map.get(instance_id, "")
-                item["object_type_property_name"] = prop_map.get(prop_id, "")
-                out.append(item)
+            out.extend(self._enrich_history(rec, self._request(path), maps, start_dt, end_dt))
         return out
 
-internal = InternalClient(MAIN_SERVER_URL, api_key=API_KEY, auth_token=AUTH_TOKEN, username=USERNAME, password=PASSWORD, refresh_token=REFRESH_TOKEN)
+    async def _aget_records(self, components, object_type, instances, properties):
+        comps = await self._acomponents()
+        query = self._records_query(comps, await self._ametadata(), components, object_type, instances, properties)
+        comp_ids = query["comp_ids"]
+        results = await self._arequest_many([f"/components/internal/{int(comp_id)}" for comp_id in comp_ids])
+        out = []
+        for comp_id, records in zip(comp_ids, results):
+            out.extend(self._enrich_records(comp_id, records, query))
+        return out, query
+
+    async def aget_records(self, components=None, object_type=None, instances=None, properties=None):
+        return (await self._aget_records(components, object_type, instances, properties))[0]
+
+    async def aiter_history(self, components=None, object_type=None, instances=None, properties=None, start=None, end=None):
+        """Yield history items in record order as soon as each row's history arrives."""
+        records, query = await self._aget_records(components, object_type, instances, properties)
+        maps = query["maps"]
+        start_dt = self._parse_dt(start)
+        end_dt = self._parse_dt(end)
+        pending = []
+        pending_paths = []
+        for rec in records:
+            path = self._history_path(rec)
+            if path is not None:
+                pending.append(rec)
+                pending_paths.append(path)
+        recs = iter(pending)
+        async with aclosing(self._aiter_requests(pending_paths)) as results:
+            async for history in results:
+                for item in self._enrich_history(next(recs), history, maps, start_dt, end_dt):
+                    yield item
+
+    async def aget_history(self, components=None, object_type=None, instances=None, properties=None, start=None, end=None):
+        items = self.aiter_history(components=components, object_type=object_type, instances=instances, properties=properties, start=start, end=end)
+        async with aclosing(items):
+            return [item async for item in items]
 
+internal = InternalClient(MAIN_SERVER_URL, api_key=API_KEY, auth_token=AUTH_TOKEN, username=USERNAME, password=PASSWORD, refresh_token=REFRESH_TOKEN, cache_ttl=META_CACHE_TTL)
 
 
-HIDDEN_TIP_NAMES = {
+
+HIDDEN_TIP_NAMES = frozenset({
+    "gap",
+    "gap_tools",
+    "resolve",
     "internal",
     "PetexServer",
     "srv",
@@ -550,7 +885,17 @@ HIDDEN_TIP_NAMES = {
     "workflow_save_output",
     "workflow_last_output_path",
     "workflow_last_output_count",
-}
+})
+
+
+def _is_visible_variable(name: str, value) -> bool:
+    # Cheapest checks first.
+    return (
+        name not in HIDDEN_TIP_NAMES
+        and not name.startswith("__")
+        and not callable(value)
+        and not isinstance(value, type)
+    )
 
 
 def _build_base_context():
@@ -568,33 +913,148 @@ def _build_base_context():
     }
 
 
+def _workflow_save_output(records, mode="append", save_to=None, component_id=None, *, workflow_component_id: int):
+    return _save_workflow_output_local(workflow_component_id=workflow_component_id, records=records, mode=mode)
+
+
+@functools.lru_cache(maxsize=1024)
+def _workflow_hooks(workflow_component_id: int):
+    """(workflow_load_inputs, workflow_save_output) bound to one workflow id, built once per id.
+
+    The id is bound in, not read from GLOBAL_CONTEXT, so cell code reassigning or
+    deleting `workflow_component_id` cannot redirect the hooks to another workflow.
+    """
+    return (
+        functools.partial(_fetch_workflow_inputs, workflow_component_id=workflow_component_id),
+        functools.partial(_workflow_save_output, workflow_component_id=workflow_component_id),
+    )
+
+
 def _set_workflow_runtime_hooks(workflow_component_id):
     if workflow_component_id is None:
         return
 
     cid = int(workflow_component_id)
     GLOBAL_CONTEXT["workflow_component_id"] = cid
-    GLOBAL_CONTEXT["workflow_load_inputs"] = (lambda _cid=cid: _fetch_workflow_inputs(workflow_component_id=_cid))
-    GLOBAL_CONTEXT["workflow_save_output"] = (
-        lambda records, mode="append", save_to=None, component_id=None, _cid=cid: (
-            _save_workflow_output_local(workflow_component_id=_cid, records=records, mode=mode)
-        )
-    )
+    GLOBAL_CONTEXT["workflow_load_inputs"], GLOBAL_CONTEXT["workflow_save_output"] = _workflow_hooks(cid)
 
 
-def _snapshot_variables(preview_chars: int = 60):
-    return {
-        k: {"type": type(v).__name__, "preview": str(v)[:preview_chars]}
-        for k, v in GLOBAL_CONTEXT.items()
-        if not k.startswith("__")
-        and not callable(v)
-        and not isinstance(v, type)
-        and k not in HIDDEN_TIP_NAMES
-    }
+# blake2b(source) -> code object; LRU-bounded.
+_CODE_CACHE = OrderedDict()
+_CODE_CACHE_SIZE = 256
+
+
+def _compile_cell(source: str):
+    digest = hashlib.blake2b(source.encode("utf-8", "surrogatepass"), digest_size=16).digest()
+    cached = _CODE_CACHE.get(digest)
+    if cached is not None:
+        _CODE_CACHE.move_to_end(digest)
+        return cached
+    code = _CODE_CACHE[digest] = compile(source, f"<cell:{digest.hex()[:8]}>", "exec")
+    if len(_CODE_CACHE) > _CODE_CACHE_SIZE:
+        _CODE_CACHE.popitem(last=False)
+    return code
+
+
+_PREVIEW = reprlib.Repr()
+_PREVIEW.maxstring = 80
+_PREVIEW.maxlist = 6
+_PREVIEW.maxdict = 4
+_PREVIEW.maxother = 80
+# Containers are previewed with reprlib so only the shown items get formatted;
+# everything else keeps its str() form.
+_REPRLIB_PREVIEW_TYPES = frozenset((list, tuple, dict, set, frozenset, deque))
+# Arrays and frames can take seconds to str(); show their shape instead.
+# Matched by module name so numpy/pandas are never imported here.
+_SHAPED_PREVIEW_MODULES = ("numpy", "pandas")
+
+
+def _preview(value, preview_chars: int) -> str:
+    try:
+        cls = type(value)
+        if cls in _REPRLIB_PREVIEW_TYPES:
+            return _PREVIEW.repr(value)[:preview_chars]
+        # Scalars (shape == ()) are cheap to str() and more useful shown by value.
+        shape = getattr(value, "shape", None) if cls.__module__.startswith(_SHAPED_PREVIEW_MODULES) else None
+        if shape:
+            dtype = getattr(value, "dtype", None)
+            text = f"<{cls.__name__} shape={tuple(shape)}"
+            return (f"{text} dtype={dtype}>" if dtype is not None else f"{text}>")[:preview_chars]
+        return str(value)[:preview_chars]
+    except Exception:
+        return "<unrepresentable>"
+
+
+def _snapshot_variables(preview_chars: int = 60, offset: int = 0, limit: int | None = None):
+    """Preview visible variables.
+
+    `offset`/`limit` select a page of the visible variables; only that page
+    is previewed.
+    """
+    visible = [(k, v) for k, v in list(GLOBAL_CONTEXT.items()) if _is_visible_variable(k, v)]
+    if offset or limit is not None:
+        visible = visible[offset:None if limit is None else offset + limit]
+    return {k: {"type": type(v).__name__, "preview": _preview(v, preview_chars)} for k, v in visible}
+
+
+class _TailBuffer(io.TextIOBase):
+    """Text sink for cell stdout/stderr that keeps only the last `max_chars` characters (0 = unbounded)."""
+
+    def __init__(self, max_chars: int):
+        self.max_chars = max_chars
+        self.dropped = 0
+        self._chunks = deque()
+        self._size = 0
+
+    def writable(self):
+        return True
+
+    def write(self, s):
+        if not isinstance(s, str):
+            raise TypeError(f"write() argument must be str, not {type(s).__name__}")
+        n = len(s)
+        if not n:
+            return 0
+        self._chunks.append(s)
+        self._size += n
+        while self.max_chars > 0 and self._size > self.max_chars:
+            excess = self._size - self.max_chars
+            head = self._chunks[0]
+            if len(head) <= excess:
+                self._chunks.popleft()
+                excess = len(head)
+            else:
+                self._chunks[0] = head[excess:]
+            self._size -= excess
+            self.dropped += excess
+        return n
+
+    def getvalue(self):
+        text = "".join(self._chunks)
+        if self.dropped:
+            return f"[... {self.dropped} earlier characters truncated ...]\n{text}"
+        return text
+
+
+def _compile_snippets(snippets):
+    """Compile all cells up front; a cell that fails to compile is kept as its exception.
+
+    Compile errors are re-raised when execution reaches that cell, so earlier
+    cells still run exactly as if each cell were compiled right before it runs.
+    """
+    compiled = []
+    for snippet in snippets:
+        try:
+            compiled.append(_compile_cell(snippet))
+        except Exception as e:
+            compiled.append(e)
+            break
+    return compiled
 
 
 def _execute_code_snippets(snippets, *, use_petex: bool, workflow_component_id=None):
-    stdout_buf, stderr_buf = io.StringIO(), io.StringIO()
+    stdout_buf, stderr_buf = _TailBuffer(MAX_OUTPUT_CHARS), _TailBuffer(MAX_OUTPUT_CHARS)
+    compiled = _compile_snippets(snippets)
 
     try:
         with _petex_server(use_petex) as srv:
@@ -605,8 +1065,10 @@ def _execute_code_snippets(snippets, *, use_petex: bool, workflow_component_id=N
                 _set_workflow_runtime_hooks(workflow_component_id)
 
             with redirect_stdout(stdout_buf), redirect_stderr(stderr_buf):
-                for snippet in snippets:
-                    exec(snippet, GLOBAL_CONTEXT)
+                for code in compiled:
+                    if isinstance(code, Exception):
+                        raise code
+                    exec(code, GLOBAL_CONTEXT)
     except Exception as e:
         stderr_buf.write(f"{type(e).__name__}: {e}\n")
     finally:
@@ -615,6 +1077,15 @@ def _execute_code_snippets(snippets, *, use_petex: bool, workflow_component_id=N
     return stdout_buf.getvalue(), stderr_buf.getvalue(), _snapshot_variables(60)
 
 
+async def _run_code_snippets(snippets, **kwargs):
+    """Run `_execute_code_snippets` on the cell thread, one request at a time."""
+    async with app.state.exec_lock:
+        return await asyncio.get_running_loop().run_in_executor(
+            app.state.exec_pool,
+            functools.partial(_execute_code_snippets, snippets, **kwargs),
+        )
+
+
 GLOBAL_CONTEXT = _build_base_context()
 
 # ==============================================================
@@ -624,29 +1095,68 @@ GLOBAL_CONTEXT = _build_base_context()
 WORKFLOW_AGENT_OUTPUT_DIR = Path(os.getenv("WORKFLOW_AGENT_OUTPUT_DIR", "./workflow_outputs")).resolve()
 
 
+# orjson writes NaN/Infinity as null (documented in README / service.env.example).
+_JSONL_OPTIONS = orjson.OPT_APPEND_NEWLINE | orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY
+
+
+def _append_bytes(path: Path, payload: bytes):
+    """Append with one unbuffered O_APPEND write (looping only on short writes)."""
+    fd = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT | getattr(os, "O_BINARY", 0), 0o666)
+    try:
+        view = memoryview(payload)
+        while view:
+            view = view[os.write(fd, view):]
+    finally:
+        os.close(fd)
+
+
+@functools.lru_cache(maxsize=1024)
 def _workflow_output_path(*, workflow_component_id: int) -> Path:
-    return WORKFLOW_AGENT_OUTPUT_DIR / f"workflow_{int(workflow_component_id)}.jsonl"
+    return WORKFLOW_AGENT_OUTPUT_DIR / f"workflow_{workflow_component_id}.jsonl"
 
 
 def _save_workflow_output_local(*, workflow_component_id: int, records, mode: str = "append"):
     if mode not in ("append", "replace"):
         raise ValueError("mode must be 'append' or 'replace'")
-
-    WORKFLOW_AGENT_OUTPUT_DIR.mkdir(parents=True, exist_ok=True)
-    path = _workflow_output_path(workflow_component_id=int(workflow_component_id))
+    workflow_component_id = int(workflow_component_id)
+    path = _workflow_output_path(workflow_component_id=workflow_component_id)
 
     items = records if isinstance(records, list) else [records]
-    text = "".join(json.dumps(item, ensure_ascii=False) + "\n" for item in (items or []))
-
-    if mode == "replace":
-        path.write_text(text, encoding="utf-8")
-    else:
-        with path.open("a", encoding="utf-8") as f:
-            f.write(text)
+    payload = b"".join(orjson.dumps(item, option=_JSONL_OPTIONS) for item in (items or []))
 
-    GLOBAL_CONTEXT["workflow_last_output_path"] = str(path)
+    write = path.write_bytes if mode == "replace" else functools.partial(_append_bytes, path)
+    try:
+        write(payload)
+    except FileNotFoundError:
+        # Only the first save (or one after the folder was removed) pays for mkdir.
+        WORKFLOW_AGENT_OUTPUT_DIR.mkdir(parents=True, exist_ok=True)
+        write(payload)
+
+    path_str = str(path)
+    GLOBAL_CONTEXT["workflow_last_output_path"] = path_str
     GLOBAL_CONTEXT["workflow_last_output_count"] = len(items or [])
-    return {"status": "saved_local", "path": str(path), "count": len(items or [])}
+    return {"status": "saved_local", "path": path_str, "count": len(items or [])}
+
+
+def _read_workflow_output_records(path: Path) -> list:
+    records = []
+    try:
+        f = path.open("rb")
+    except FileNotFoundError:
+        return records
+    with f:
+        for line in f:
+            if line.isspace():
+                continue
+            try:
+                records.append(orjson.loads(line))
+            except orjson.JSONDecodeError:
+                # Lines written by the older stdlib-json saver may contain NaN/Infinity.
+                try:
+                    records.append(json.loads(line))
+                except Exception:
+                    continue
+    return records
 
 
 def _save_workflow_output_db(*, workflow_component_id: int, records, component_id=None):
@@ -655,7 +1165,7 @@ def _save_workflow_output_db(*, workflow_component_id: int, records, component_i
     The Django backend currently has no dedicated API to persist workflow outputs,
     so we fall back to local JSONL persistence.
     """
-    result = _save_workflow_output_local(workflow_component_id=int(workflow_component_id), records=records, mode="append")
+    result = _save_workflow_output_local(workflow_component_id=workflow_component_id, records=records, mode="append")
     result["status"] = "saved_local_db_fallback"
     result["component_id"] = component_id
     return result
@@ -668,7 +1178,7 @@ def _save_workflow_output_db(*, workflow_component_id: int, records, component_i
 
 @app.exception_handler(Exception)
 async def all_exceptions_handler(request: Request, exc: Exception):
-    return JSONResponse(status_code=500, content={"error": str(exc)})
+    return ORJSONResponse(status_code=500, content={"error": str(exc)})
 
 
 # ==============================================================
@@ -678,19 +1188,19 @@ async def all_exceptions_handler(request: Request, exc: Exception):
 
 @app.post("/run_cell/")
 async def run_cell(request: Request):
-    data = await request.json()
+    data = await _read_json(request)
     code = data.get("code", "")
     use_petex = bool(data.get("use_petex", False))
     workflow_component_id = data.get("workflow_component_id")
     _apply_request_auth(request)
 
-    stdout, stderr, variables = _execute_code_snippets(
+    stdout, stderr, variables = await _run_code_snippets(
         [code],
         use_petex=use_petex,
         workflow_component_id=workflow_component_id,
     )
 
-    return JSONResponse(
+    return ORJSONResponse(
         {
             "stdout": stdout,
             "stderr": stderr,
@@ -701,20 +1211,20 @@ async def run_cell(request: Request):
 
 @app.post("/run_all/")
 async def run_all(request: Request):
-    data = await request.json()
+    data = await _read_json(request)
     cells = data.get("cells", [])
     use_petex = bool(data.get("use_petex", False))
     workflow_component_id = data.get("workflow_component_id")
     _apply_request_auth(request)
 
     snippets = cells if isinstance(cells, list) else ([cells] if cells else [])
-    stdout, stderr, variables = _execute_code_snippets(
+    stdout, stderr, variables = await _run_code_snippets(
         snippets,
         use_petex=use_petex,
         workflow_component_id=workflow_component_id,
     )
 
-    return JSONResponse(
+    return ORJSONResponse(
         {
             "stdout": stdout,
             "stderr": stderr,
@@ -729,46 +1239,93 @@ async def run_all(request: Request):
 
 
 @app.get("/variables/")
-async def list_variables():
-    result = _snapshot_variables(preview_chars=80)
-    return JSONResponse(result)
+async def list_variables(offset: int = Query(0, ge=0), limit: int | None = Query(None, ge=1)):
+    # Read-only, so no exec_lock: the UI can poll while a long cell runs
+    # (_snapshot_variables works on a copy of the items).
+    result = _snapshot_variables(preview_chars=80, offset=offset, limit=limit)
+    return ORJSONResponse(result)
 
 
 @app.post("/reset_context/")
 async def reset_context():
-    GLOBAL_CONTEXT.clear()
-    GLOBAL_CONTEXT.update(_build_base_context())
-    return JSONResponse({"status": "reset"})
+    async with app.state.exec_lock:
+        GLOBAL_CONTEXT.clear()
+        # Rebuilt rather than copied so mutations of `pi` don't survive a reset.
+        GLOBAL_CONTEXT.update(_build_base_context())
+    internal.clear_cache()
+    return ORJSONResponse({"status": "reset"})
 
 
 @app.post("/delete_var/")
 async def delete_var(request: Request):
-    data = await request.json()
+    data = await _read_json(request)
     name = data.get("name")
-    if name and name in GLOBAL_CONTEXT:
-        del GLOBAL_CONTEXT[name]
-    return JSONResponse({"status": "ok", "deleted": name})
+    if name:
+        # Wait for a running cell, as /reset_context/ does, rather than change its globals mid-run.
+        async with app.state.exec_lock:
+            GLOBAL_CONTEXT.pop(name, None)
+    return ORJSONResponse({"status": "ok", "deleted": name})
+
+
+_TRUTHY = frozenset(("1", "true", "yes"))
+_VAR_CONVERTERS = {
+    "int": int,
+    "float": float,
+    "bool": lambda v: str(v).lower() in _TRUTHY,
+    "str": str,
+}
 
 
 @app.post("/set_var/")
 async def set_var(request: Request):
-    data = await request.json()
+    data = await _read_json(request)
     name = data.get("name")
     value = data.get("value")
     vtype = data.get("type", "str")
     try:
-        if vtype == "int":
-            value = int(value)
-        elif vtype == "float":
-            value = float(value)
-        elif vtype == "bool":
-            value = str(value).lower() in ("1", "true", "yes")
-        else:
-            value = str(value)
-        GLOBAL_CONTEXT[name] = value
-        return JSONResponse({"status": "ok", "name": name, "value": value})
+        value = _VAR_CONVERTERS.get(vtype, str)(value)
     except Exception as e:
-        return JSONResponse({"status": "error", "msg": str(e)}, status_code=400)
+        return ORJSONResponse({"status": "error", "msg": str(e)}, status_code=400)
+    async with app.state.exec_lock:
+        GLOBAL_CONTEXT[name] = value
+    try:
+        return ORJSONResponse({"status": "ok", "name": name, "value": value})
+    except orjson.JSONEncodeError:
+        # e.g. ints beyond 64 bits; the variable is set, only the echo falls back.
+        return ORJSONResponse({"status": "ok", "name": name, "value": str(value)})
+
+
+# ==============================================================
+# Internal data (streamed)
+# ==============================================================
+
+
+@app.get("/history/stream/")
+async def stream_history(
+    request: Request,
+    components: list[str] | None = Query(None),
+    object_type: list[str] | None = Query(None),
+    instances: list[str] | None = Query(None),
+    properties: list[str] | None = Query(None),
+    start: str | None = None,
+    end: str | None = None,
+):
+    _apply_request_auth(request)
+    items = internal.aiter_history(
+        components=components,
+        object_type=object_type,
+        instances=instances,
+        properties=properties,
+        start=start,
+        end=end,
+    )
+    # Pull the first item here so auth/lookup failures still become a normal error response.
+    try:
+        first = await anext(items, None)
+    except BaseException:
+        await items.aclose()
+        raise
+    return StreamingResponse(_ndjson(first, items), media_type="application/x-ndjson")
 
 
 # ==============================================================
@@ -778,22 +1335,9 @@ async def set_var(request: Request):
 
 @app.get("/workflow_outputs/{workflow_component_id}/")
 async def get_workflow_outputs(workflow_component_id: int):
-    path = _workflow_output_path(workflow_component_id=int(workflow_component_id))
-    if not path.exists():
-        return JSONResponse({"records": [], "path": str(path)})
-
-    records = []
-    with path.open("r", encoding="utf-8") as f:
-        for line in f:
-            line = line.strip()
-            if not line:
-                continue
-            try:
-                records.append(json.loads(line))
-            except Exception:
-                continue
-
-    return JSONResponse({"records": records, "path": str(path)})
+    path = _workflow_output_path(workflow_component_id=workflow_component_id)
+    records = await asyncio.to_thread(_read_workflow_output_records, path)
+    return ORJSONResponse({"records": records, "path": str(path)})
 
 
 